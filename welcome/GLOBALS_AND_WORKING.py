@@ -1,9 +1,58 @@
 import threading
-from typing import Dict, Deque, Tuple
-from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional, Tuple
+from collections import OrderedDict, deque
 
 
+@dataclass
+class PerKeyState:
+    """History of one (character, persona) conversation plus its own lock."""
+    history: Deque[Tuple[str, str]]
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # Last assembled code context and the (snippets, project_context, max_chars) that produced it
+    context_inputs: Optional[tuple] = None
+    code_block: str = ""
+    # "role: text" lines of history, kept only once someone asks for it (Ollama)
+    flat: Optional[str] = None
+
+    def append(self, role: str, text: str) -> None:
+        """Append a turn; caller holds `lock`."""
+        evicting = len(self.history) == self.history.maxlen
+        self.history.append((role, text))
+        if self.flat is None:
+            return
+        if evicting:
+            # The oldest line fell off the deque: rebuild on next request
+            self.flat = None
+        elif self.flat:
+            self.flat += f"\n{role}: {text}"
+        else:
+            self.flat = f"{role}: {text}"
+
+    def flat_prompt(self) -> str:
+        """History as a flat prompt; caller holds `lock`."""
+        if self.flat is None:
+            self.flat = "\n".join(f"{r}: {t}" for r, t in self.history)
+        return self.flat
+
+
+# Only guards the mapping itself (lookup order, insert, evict, reset);
+# per-conversation work uses PerKeyState.lock.
 LOCK: threading.Lock = threading.Lock()
-CONVERSATIONS: Dict[Tuple[str, int], Deque[Tuple[str, str]]] = {}
+# LRU: least recently used conversations are dropped past MAX_CONVERSATIONS
+MAX_CONVERSATIONS: int = 10_000
+CONVERSATIONS: "OrderedDict[Tuple[str, int], PerKeyState]" = OrderedDict()
+
+
+def get_conversation(key: Tuple[str, int], maxlen: int) -> PerKeyState:
+    with LOCK:
+        state = CONVERSATIONS.get(key)
+        if state is not None:
+            CONVERSATIONS.move_to_end(key)
+            return state
+        state = CONVERSATIONS[key] = PerKeyState(deque(maxlen=maxlen))
+        while len(CONVERSATIONS) > MAX_CONVERSATIONS:
+            CONVERSATIONS.popitem(last=False)
+    return state
 
 HASCREATEDJSONSKILLS:bool = False
\ No newline at end of file
@@ -2,82 +2,157 @@ from __future__ import annotations
 
 import json
 import logging
-import threading
 from typing import Deque, Dict, List, Tuple, Union
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
 
 from .GLOBALS_AND_WORKING import LOCK, CONVERSATIONS
 from .models import Persona
 
-logging.getLogger("faiss.loader").setLevel(logging.ERROR)
+try:
+    import orjson
+except ModuleNotFoundError:  # pragma: no cover - environment without orjson
+    orjson = None
+
 log = logging.getLogger("custom")
 
+def _json_loads(raw: bytes | str):
+    return orjson.loads(raw) if orjson else json.loads(raw)
+
+def _json_dumps(data) -> bytes:
+    return orjson.dumps(data) if orjson else json.dumps(data).encode()
+
+def _json_response(data, status: int = 200) -> HttpResponse:
+    """Drop-in for JsonResponse(dict) that encodes with orjson when available."""
+    return HttpResponse(_json_dumps(data), status=status, content_type="application/json")
+
 def _conversation_key(character: str | None, persona_pk: int) -> Tuple[str, int]:
     return (character or "anonymous", persona_pk)
 
 def _conversation_dump(character: str | None) -> Dict[str, List[Dict[str, str]]]:
-    result: Dict[str, List[Dict[str, str]]] = {}
+    owner = character or "anonymous"
+    # CONVERSATIONS is reordered/evicted under LOCK, so copy its items under it too;
+    # each history is then copied under its own per-key lock. The DB lookup
+    # happens without holding any lock, and message dicts are built afterwards.
     with LOCK:
-        for (p, persona_pk), history in CONVERSATIONS.items():
-            if p != (character or "anonymous"):
-                continue
-            try:
-                persona = Persona.objects.get(pk=persona_pk)
-            except Persona.DoesNotExist:
-                continue
-            result.setdefault(persona.nome, []).extend(
-                {"role": r, "content": t} for r, t in history
-            )
+        items = list(CONVERSATIONS.items())
+    snapshot: List[Tuple[int, Tuple[Tuple[str, str], ...]]] = []
+    for (p, persona_pk), state in items:
+        if p != owner:
+            continue
+        with state.lock:
+            snapshot.append((persona_pk, tuple(state.history)))
+
+    # One query for every persona in the snapshot; only the name is needed
+    personas = Persona.objects.only("pk", "nome").in_bulk([pk for pk, _ in snapshot])
+    result: Dict[str, List[Dict[str, str]]] = {}
+    for persona_pk, history in snapshot:
+        persona = personas.get(persona_pk)
+        if persona is None:
+            continue
+        messages = [{"role": r, "content": t} for r, t in history]
+        if persona.nome in result:
+            result[persona.nome] += messages
+        else:
+            result[persona.nome] = messages
     return result
 
+# The default cache (LocMemCache) is per-process: invalidation only reaches the
+# worker that saved, others may serve a stale list for up to this many seconds
+PERSONAS_CACHE_TIMEOUT = 300
+
+def _personas_cache_key(master_mode: bool, inglese: bool | None) -> str:
+    return f"personas_list:v1:master={int(master_mode)}:inglese={inglese}"
+
+@receiver((post_save, post_delete), sender=Persona)
+def _invalidate_personas_cache(sender, **kwargs) -> None:
+    # persona_add_experience saves only esperienze, which the list does not show
+    if kwargs.get("update_fields") == {"esperienze"}:
+        return
+    cache.delete_many([
+        _personas_cache_key(master_mode, inglese)
+        for master_mode in (False, True)
+        for inglese in (None, False, True)
+    ])
+
 def personas_list(request):
     master_mode = request.GET.get("master") == "true"
     inglese_param = request.GET.get("inglese")
-    qs = Persona.objects.all()
-    if inglese_param is not None:
-        qs = qs.filter(inglese=inglese_param.lower() == "true")
-    if not master_mode:
-        qs = qs.filter(inglese=False)
-    data = [
-        {
-            "id": p.pk,
-            "nome": p.nome,
-            "versione": p.versione,
-        }
-        for p in qs.order_by("nome")
-    ]
-    return JsonResponse({"personas": data})
+    inglese = None if inglese_param is None else inglese_param.lower() == "true"
+
+    def build() -> str:
+        qs = Persona.objects.all()
+        if inglese is not None:
+            qs = qs.filter(inglese=inglese)
+        if not master_mode:
+            qs = qs.filter(inglese=False)
+        data = [
+            {
+                "id": p.pk,
+                "nome": p.nome,
+                "versione": p.versione,
+            }
+            for p in qs.order_by("nome")
+        ]
+        return _json_dumps({"personas": data})
+
+    # Cache the serialized body: a hit skips both the query and the encoder
+    body = cache.get_or_set(_personas_cache_key(master_mode, inglese), build, PERSONAS_CACHE_TIMEOUT)
+    return HttpResponse(body, content_type="application/json")
 
 def ollama_get_conversations(request):
     if request.method != "POST":
-        return JsonResponse({"error": "Invalid request method."}, status=400)
+        return _json_response({"error": "Invalid request method."}, status=400)
     try:
-        data = json.loads(request.body)
+        data = _json_loads(request.body)
         character = data.get("character")
     except Exception:
-        return JsonResponse({"error": "Invalid JSON"}, status=400)
+        return _json_response({"error": "Invalid JSON"}, status=400)
     if not character:
-        return JsonResponse({"error": "character required."}, status=400)
-    return JsonResponse({"conversations": _conversation_dump(character)})
+        return _json_response({"error": "character required."}, status=400)
+    return _json_response({"conversations": _conversation_dump(character)})
+
+# esperienze is concatenated into every chat's system prompt: keep it bounded
+PERSONA_ESPERIENZE_MAX_BYTES = 128 * 1024
+
+def _cap_esperienze(esperienze: str, newest: str) -> str:
+    """
+    Drop the oldest ';'-terminated entries until `esperienze` fits the cap (UTF-8 bytes).
+    `esperienze` must end with `newest`, which is always kept.
+    """
+    data = esperienze.encode()
+    if len(data) <= PERSONA_ESPERIENZE_MAX_BYTES:
+        return esperienze
+    # First ';' whose following text fits the cap, searched before the newest entry.
+    # ';' is ASCII, so cutting right after it never splits a multi-byte character.
+    cut = data.find(b";", len(data) - PERSONA_ESPERIENZE_MAX_BYTES - 1, len(data) - len(newest.encode()))
+    if cut == -1:
+        return newest
+    return data[cut + 1:].decode().lstrip()
 
 def persona_add_experience(request):
     try:
-        data = json.loads(request.body)
+        data = _json_loads(request.body)
         nome = data["nome"]
         versione = data.get("versione", "1")
         text = data["text"].strip()
     except (KeyError, ValueError, json.JSONDecodeError):
-        return JsonResponse({"error": "Payload non valido."}, status=400)
+        return _json_response({"error": "Payload non valido."}, status=400)
     if not text:
-        return JsonResponse({"error": "Testo vuoto."}, status=400)
-    try:
-        persona = Persona.objects.get(nome=nome, versione=versione)
-    except Persona.DoesNotExist:
-        return JsonResponse({"error": "Persona non trovata."}, status=404)
-    suffix = ";\n"
-    nuovo = (persona.esperienze or "").rstrip()
-    if nuovo and not nuovo.endswith(";"):
-        nuovo += ";"
-    persona.esperienze = f"{nuovo} {text}{suffix}".lstrip()
-    persona.save(update_fields=["esperienze"])
-    return JsonResponse({"ok": True})
+        return _json_response({"error": "Testo vuoto."}, status=400)
+    with transaction.atomic():
+        # Row lock so concurrent appends don't overwrite each other
+        try:
+            persona = Persona.objects.select_for_update().only("esperienze").get(nome=nome, versione=versione)
+        except Persona.DoesNotExist:
+            return _json_response({"error": "Persona non trovata."}, status=404)
+        suffix = ";\n"
+        nuovo = (persona.esperienze or "").rstrip()
+        if nuovo and not nuovo.endswith(";"):
+            nuovo += ";"
+        persona.esperienze = _cap_esperienze(f"{nuovo} {text}{suffix}".lstrip(), f"{text}{suffix}")
+        persona.save(update_fields=["esperienze"])
+    return _json_response({"ok": True})
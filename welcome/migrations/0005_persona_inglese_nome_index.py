@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('welcome', '0004_persona_ristretto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='persona',
+            index=models.Index(fields=['inglese', 'nome'], name='welcome_per_inglese_79c614_idx'),
+        ),
+    ]
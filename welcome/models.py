@@ -20,6 +20,8 @@ class Persona(models.Model):
     )
     class Meta:
         unique_together = ('nome', 'versione')
+        # personas_list filters on inglese and orders by nome
+        indexes = [models.Index(fields=['inglese', 'nome'])]
 
     def __str__(self):
         return f"{self.nome} v{self.versione}"
\ No newline at end of file
@@ -1,32 +1,77 @@
 # programming_helper_api.py
 from __future__ import annotations
 
-import json
+import asyncio
+import hashlib
 import logging
 import os
 import re
-from collections import deque
-from typing import Deque, Dict, List, Tuple, Union
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Tuple, Union
 
 try:
-    import requests
-except ModuleNotFoundError:  # pragma: no cover - environment without requests
-    requests = None
-
-from django.http import JsonResponse
+    import httpx
+except ModuleNotFoundError:  # pragma: no cover - environment without httpx
+    httpx = None
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 try:
-    from openai import OpenAI
+    from openai import AsyncOpenAI
 except ModuleNotFoundError:  # pragma: no cover - environment without openai
-    OpenAI = None
+    AsyncOpenAI = None
 
 # Reuse your shared state & utils exactly like your current endpoint
-from .GLOBALS_AND_WORKING import LOCK, CONVERSATIONS
-from .chatbot_utils import _conversation_key, _conversation_dump
+from .GLOBALS_AND_WORKING import LOCK, CONVERSATIONS, get_conversation
+from .chatbot_utils import _conversation_key, _conversation_dump, _json_dumps, _json_loads, _json_response
 from .models import Persona
 
 log = logging.getLogger("custom")
 
+# Async clients are bound to the event loop that created them. Under ASGI the
+# server runs one long-lived loop, so pooled clients are kept per loop and
+# shared by every request (runserver is ASGI too, via daphne). Under a WSGI
+# server each request runs on a throwaway loop: there clients are opened per
+# call and closed when it ends.
+_LOOP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+def _loop_clients() -> Dict[str, Any]:
+    return _LOOP_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+
+def _shared_http_client() -> "httpx.AsyncClient":
+    clients = _loop_clients()
+    client = clients.get("http")
+    if client is None:
+        limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        client = clients["http"] = httpx.AsyncClient(limits=limits)
+    return client
+
+@asynccontextmanager
+async def _http_client(shared: bool) -> AsyncIterator["httpx.AsyncClient"]:
+    """Pooled client on a long-lived loop, otherwise one closed after the call."""
+    if shared:
+        yield _shared_http_client()
+    else:
+        async with httpx.AsyncClient() as client:
+            yield client
+
+@asynccontextmanager
+async def _openai_client(api_key: str, shared: bool) -> AsyncIterator["AsyncOpenAI"]:
+    """Like `_http_client`: one cached client per API key only on a long-lived loop."""
+    if shared:
+        clients = _loop_clients()
+        client = clients.get(f"openai:{api_key}")
+        if client is None:
+            client = clients[f"openai:{api_key}"] = AsyncOpenAI(api_key=api_key, http_client=_shared_http_client())
+        yield client
+    else:
+        async with AsyncOpenAI(api_key=api_key) as client:
+            yield client
+
 # ——— Config & Models ———
 # Default persona id used when none is specified
 PROGRAMMING_HELPER_PERSONA_ID = -42042
@@ -38,6 +83,7 @@ CHARS_PER_TOKEN = 4
 LARGE_CHAR_BUDGET = TOKEN_TARGET_UNLOCK * CHARS_PER_TOKEN
 
 # Ollama
+OLLAMA_API_URL = "http://localhost:11434/api/generate"
 OLLAMA_QWEN_BASE = "qwen3:8b"
 OLLAMA_MISTRAL = "mistral"
 OLLAMA_QWEN_14 = "huihui_ai/qwen2.5-abliterate:14b"
@@ -63,6 +109,16 @@ OPENROUTER_MODEL_S    = "mistralai/mistral-small-3.2-24b-instruct"
 OPENROUTER_MODEL_M    = "thedrummer/anubis-70b-v1.1"
 OPENROUTER_MODEL_L    = "deepseek/deepseek-chat-v3-0324"
 
+# size -> model, per provider (built once instead of per request)
+_OLLAMA_MODELS = {"s": OLLAMA_QWEN_BASE, "m": OLLAMA_MISTRAL, "l": OLLAMA_QWEN_14, "r": OLLAMA_QWEN_14}
+_OLLAMA_DEFAULT = OLLAMA_QWEN_14
+_MISTRAL_MODELS = {"s": MISTRAL_MODEL_S, "m": MISTRAL_MODEL_M, "l": MISTRAL_MODEL_L, "r": MISTRAL_MODEL_R}
+_MISTRAL_DEFAULT = MISTRAL_MODEL_M
+_OPENAI_MODELS = {"s": OPENAI_MODEL_S, "m": OPENAI_MODEL_L, "l": OPENAI_MODEL_L, "r": OPENAI_MODEL_R}
+_OPENAI_DEFAULT = OPENAI_MODEL_L
+_OPENROUTER_MODELS = {"s": OPENROUTER_MODEL_S, "m": OPENROUTER_MODEL_M, "l": OPENROUTER_MODEL_L, "r": OPENROUTER_MODEL_L}
+_OPENROUTER_DEFAULT = OPENROUTER_MODEL_S
+
 
 # ——— System prompt ———
 PROGRAMMING_HELPER_SYSTEM = """
@@ -108,13 +164,18 @@ def _rp_system_prompt() -> str:
         return ""
 
 # ——— Helpers ———
-def _build_messages(history: Deque[Tuple[str, str]], system_prompt: str) -> List[Dict[str, str]]:
+def _build_messages(history: Iterable[Tuple[str, str]], system_prompt: str) -> List[Dict[str, str]]:
     msgs = [{"role": "system", "content": system_prompt}]
     for role, text in history:
         msgs.append({"role": role, "content": text})
     return msgs
 
 
+# Snippet framing, formatted with % so blocks are appended piecewise
+_FILE_HEADER = "\n--- BEGIN FILE: %s ---\n"
+_FENCE_OPEN = "```%s\n"
+_FILE_FOOTER = "\n```\n--- END FILE ---\n"
+
 def _assemble_code_context(snippets: List[Dict[str, str]] | None, project_context: str | None, max_chars: int = 12000) -> str:
     """
     Build an auxiliary context block from user-provided code snippets.
@@ -136,20 +197,20 @@ def _assemble_code_context(snippets: List[Dict[str, str]] | None, project_contex
             code = (sn.get("content") or "").strip()
             if not code:
                 continue
-            header = f"\n--- BEGIN FILE: {name} ---\n"
-            fence_open = f"```{lang}\n" if lang else "```\n"
-            block = header + fence_open + code + "\n```\n--- END FILE ---\n"
-            if total + len(block) > max_chars:
+            header = _FILE_HEADER % name
+            fence_open = _FENCE_OPEN % lang
+            size = len(header) + len(fence_open) + len(code) + len(_FILE_FOOTER)
+            if total + size > max_chars:
                 remaining = max_chars - total
                 if remaining <= 0:
                     parts.append("\n[Truncated additional code due to size limit]")
                     break
-                # truncate this block
+                # truncate this block (the only one ever concatenated)
+                block = header + fence_open + code + _FILE_FOOTER
                 parts.append(block[:remaining] + "\n[...truncated]\n")
-                total = max_chars + 1
                 break
-            parts.append(block)
-            total += len(block)
+            parts += (header, fence_open, code, _FILE_FOOTER)
+            total += size
 
     return (
         "Auxiliary code/context provided by the user (treat as source of truth when relevant):\n"
@@ -157,6 +218,63 @@ def _assemble_code_context(snippets: List[Dict[str, str]] | None, project_contex
         + "\nEnd of auxiliary context.\n"
     )
 
+# ——— Provider streams: each yields text deltas as the model produces them ———
+async def _ollama_deltas(payload: Dict[str, Any], shared: bool) -> AsyncIterator[str]:
+    # Ollama streams one JSON object per line
+    async with _http_client(shared) as client:
+        async with client.stream("POST", OLLAMA_API_URL, json=payload, timeout=120) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                chunk = _json_loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+
+
+async def _sse_deltas(url: str, body: Dict[str, Any], headers: Dict[str, str], timeout: float,
+                      shared: bool) -> AsyncIterator[str]:
+    # OpenAI-compatible chat completions (Mistral, OpenRouter) stream Server-Sent Events
+    async with _http_client(shared) as client:
+        async with client.stream("POST", url, json=body, headers=headers, timeout=timeout) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue  # blank separators and ": keep-alive" comments
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                chunk = _json_loads(data)
+                error = chunk.get("error")
+                if error:
+                    # Mid-stream failures arrive as a normal event with an "error" object
+                    raise RuntimeError(error.get("message", error) if isinstance(error, dict) else error)
+                choices = chunk.get("choices") or []
+                content = (choices[0].get("delta") or {}).get("content") if choices else None
+                if content:
+                    yield content
+
+
+async def _openai_deltas(api_key: str, shared: bool, **kwargs: Any) -> AsyncIterator[str]:
+    # The client is opened here so it belongs to the loop that consumes the stream
+    async with _openai_client(api_key, shared) as client:
+        stream = await client.responses.create(stream=True, **kwargs)
+        async for event in stream:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+            elif event.type == "error":
+                raise RuntimeError(event.message)
+            elif event.type == "response.failed":
+                error = event.response.error
+                raise RuntimeError(error.message if error else "response failed")
+            elif event.type == "response.incomplete":
+                # Truncated (e.g. max_output_tokens): keep what arrived, the caller rejects empty replies
+                details = event.response.incomplete_details
+                log.warning("OpenAI response incomplete: %s", details.reason if details else "unknown reason")
+                break
+
 def _resolve_persona(persona_id: int | None,
                      persona_name: str | None,
                      inglese: bool | None) -> tuple[int | None, "Persona | None"]:
@@ -166,15 +284,17 @@ def _resolve_persona(persona_id: int | None,
       2) latest (by versione then id) matching persona_name + inglese
     """
     from .models import Persona
+    # Only the columns the chat needs (skips inglese/ristretto)
+    personas = Persona.objects.only("nome", "versione", "contenuto", "esperienze")
     if persona_id:
         try:
-            p = Persona.objects.get(pk=persona_id)
+            p = personas.get(pk=persona_id)
             return p.id, p
         except Persona.DoesNotExist:
             pass
 
     if persona_name:
-        qs = Persona.objects.filter(nome=persona_name)
+        qs = personas.filter(nome=persona_name)
         if inglese is not None:
             qs = qs.filter(inglese=inglese)
         p = qs.order_by("-versione", "-id").first()
@@ -183,19 +303,24 @@ def _resolve_persona(persona_id: int | None,
 
     return None, None
 
+_AUTO_LANG_RULE = "Reply in the same language as the user's last message (Italian or English)."
+_DEFAULT_LANG_RULE = "Reply in the same language as the user's last message."
+# Exact values first, then two-letter prefixes ("it", "it-IT", "italiano", ...)
+_LANG_RULES = {"": _AUTO_LANG_RULE, "auto": _AUTO_LANG_RULE, "detect": _AUTO_LANG_RULE, "same": _AUTO_LANG_RULE}
+_LANG_PREFIX_RULES = {"it": "Reply in Italian.", "en": "Reply in English."}
+
 def _language_directive(lang: str | None) -> str:
-    if not lang or lang.lower() in ("auto", "detect", "same"):
-        return "Reply in the same language as the user's last message (Italian or English)."
-    if lang.lower().startswith("it"):
-        return "Reply in Italian."
-    if lang.lower().startswith("en"):
-        return "Reply in English."
-    return "Reply in the same language as the user's last message."
+    # lang arrives already stripped and lowercased by the view
+    key = lang or ""
+    rule = _LANG_RULES.get(key)
+    if rule is None:
+        rule = _LANG_PREFIX_RULES.get(key[:2], _DEFAULT_LANG_RULE)
+    return rule
 
 
 # ——— Main endpoint ———
 @csrf_exempt
-def programming_helper_send_message(request):  # noqa: C901
+async def programming_helper_send_message(request):  # noqa: C901
     """
     POST JSON body:
     {
@@ -212,7 +337,8 @@ def programming_helper_send_message(request):  # noqa: C901
         {"filename":"app.py","language":"python","content":"..."},
         {"filename":"index.tsx","language":"typescript","content":"..."}
       ],
-      "project_context": "short free text about stack/config"  # optional
+      "project_context": "short free text about stack/config",  # optional
+      "stream": true                       # optional, see below
     }
 
     Response (same shape as your existing API):
@@ -220,18 +346,22 @@ def programming_helper_send_message(request):  # noqa: C901
       "response": "<assistant text>",
       "conversations": <_conversation_dump(character)>
     }
+
+    With "stream": true the body is NDJSON (application/x-ndjson): one
+    {"delta": "<text>"} line per chunk as the model generates, then a last
+    line with the full response object above (or {"error": "..."}).
     """
     if request.method != "POST":
-        return JsonResponse({"error": "Invalid request method."}, status=400)
+        return _json_response({"error": "Invalid request method."}, status=400)
 
     try:
-        data = json.loads(request.body)
+        data = _json_loads(request.body)
     except Exception:
-        return JsonResponse({"error": "Invalid JSON"}, status=400)
+        return _json_response({"error": "Invalid JSON"}, status=400)
 
     message: str = (data.get("message") or "").strip()
     if not message:
-        return JsonResponse({"error": "Message required."}, status=400)
+        return _json_response({"error": "Message required."}, status=400)
 
     local = (data.get("local") or "ollama").strip().lower()
     size = (data.get("size") or "m").strip().lower()
@@ -257,12 +387,14 @@ def programming_helper_send_message(request):  # noqa: C901
         persona_id = int(raw_id) if raw_id is not None else None
     except (TypeError, ValueError):
         persona_id = None
-    persona_id, persona_obj = _resolve_persona(persona_id, persona_name, inglese_flag)
+    persona_id, persona_obj = await sync_to_async(_resolve_persona)(persona_id, persona_name, inglese_flag)
     if persona_id is None:
         persona_id = PROGRAMMING_HELPER_PERSONA_ID
 
     if topic and not persona_obj:
-        persona_key_fragment = abs(hash(("ph", topic))) % (10**6)
+        # hash() is salted per process: use a digest so topics map to the same key after a restart
+        topic_digest = hashlib.blake2b(topic.encode(), digest_size=4, person=b"ph").digest()
+        persona_key_fragment = int.from_bytes(topic_digest, "big") % (10**6)
         persona_id = - (100000 + persona_key_fragment)
 
     key = _conversation_key(character, persona_id)
@@ -271,139 +403,126 @@ def programming_helper_send_message(request):  # noqa: C901
     if message.lower() == "reset":
         with LOCK:
             CONVERSATIONS.pop(key, None)
-        return JsonResponse({"response": "Conversation has been reset."})
+        return _json_response({"response": "Conversation has been reset."})
 
     # Append user turn & enforce max history
-    MAX_USER_MESSAGES = 200 if (character.lower() == "master") else 24
-    with LOCK:
-        history: Deque[Tuple[str, str]] = CONVERSATIONS.setdefault(key, deque(maxlen=MAX_USER_MESSAGES * 2))
-        user_turns = sum(1 for role, _ in history if role == "user")
+    MAX_USER_MESSAGES = 200 if character.lower() == "master" else 24
+    state = get_conversation(key, MAX_USER_MESSAGES * 2)
+    with state.lock:
+        user_turns = sum(1 for role, _ in state.history if role == "user")
         if user_turns >= MAX_USER_MESSAGES:
-            return JsonResponse({"error": "Turn limit reached."}, status=403)
-        history.append(("user", message))
+            return _json_response({"error": "Turn limit reached."}, status=403)
+        state.append("user", message)
+        # Snapshot so the provider call never iterates the live deque
+        history: Tuple[Tuple[str, str], ...] = tuple(state.history)
         # Ollama requires a flat prompt version of the convo as well
-        prompt_for_ollama = "\n".join(f"{r}: {t}" for r, t in history)
+        prompt_for_ollama = state.flat_prompt() if local == "ollama" else None
 
     # Build system content (base + language directive + optional code context)
     lang_rule = _language_directive(lang)
-    code_block = _assemble_code_context(snippets, project_context,max_chars=(LARGE_CHAR_BUDGET if unlock else 12000),)
+    max_chars = LARGE_CHAR_BUDGET if unlock else 12000
+    if snippets or project_context:
+        # Snippets rarely change between turns: reuse the last assembly when the inputs match
+        inputs = (snippets, project_context, max_chars)
+        with state.lock:
+            cached = state.code_block if state.context_inputs == inputs else None
+        if cached is None:
+            cached = _assemble_code_context(snippets, project_context, max_chars=max_chars)
+            with state.lock:
+                state.context_inputs, state.code_block = inputs, cached
+        code_block = cached
+    else:
+        code_block = ""
     if persona_obj:
         system_base = persona_obj.contenuto
         if persona_obj.esperienze:
             system_base = f"{system_base}\n\nUlteriori Esperienze della Persona:\n{persona_obj.esperienze}"
     else:
         system_base = PROGRAMMING_HELPER_SYSTEM
-    rp_block = (_rp_system_prompt() + "\n\n") if rp else ""
+    rp_block = (await sync_to_async(_rp_system_prompt)() + "\n\n") if rp else ""
     combined_system = f"{rp_block}{system_base}\n\n{lang_rule}\n\n{code_block}".strip()
     # Provider calls
     context_limit = TOKEN_TARGET_UNLOCK if unlock else CONTEXT_ASSISTANT
-    reply: str = ""
+    messages: List[Dict[str, str]] | None = None
+    # Only an ASGI server keeps its event loop alive between requests
+    shared_clients = isinstance(request, ASGIRequest)
 
     if local == "ollama":
-        if requests is None:
-            return JsonResponse({"error": "requests library not installed"}, status=500)
-        model = {
-            "s": OLLAMA_QWEN_BASE,
-            "m": OLLAMA_MISTRAL,
-            "l": OLLAMA_QWEN_14,
-            "r": OLLAMA_QWEN_14,
-        }.get(size, OLLAMA_QWEN_14)
+        if httpx is None:
+            return _json_response({"error": "httpx library not installed"}, status=500)
+        model = _OLLAMA_MODELS.get(size, _OLLAMA_DEFAULT)
         payload = {
             "model": model,
             "prompt": prompt_for_ollama,
             "system": combined_system,
-            "stream": False,
+            "stream": True,
             "think": False,
             "hidethinking": True,
         }
         print(f"Model in use: {model}")
-        try:
-            resp = requests.post("http://localhost:11434/api/generate", json=payload, timeout=120)
-            resp.raise_for_status()
-            reply = resp.json().get("response", "")
-        except Exception as exc:
-            return JsonResponse({"error": f"Ollama call failed: {exc}"}, status=500)
+        failure = "Ollama call failed"
+        deltas = _ollama_deltas(payload, shared_clients)
 
     elif local == "mistral":
-        if requests is None:
-            return JsonResponse({"error": "requests library not installed"}, status=500)
+        if httpx is None:
+            return _json_response({"error": "httpx library not installed"}, status=500)
         api_key = os.getenv("MISTRAL_API_KEY")
         if not api_key:
-            return JsonResponse({"error": "MISTRAL_API_KEY not set"}, status=500)
+            return _json_response({"error": "MISTRAL_API_KEY not set"}, status=500)
         messages = _build_messages(history, combined_system)
-        model = {
-            "s": MISTRAL_MODEL_S,
-            "m": MISTRAL_MODEL_M,
-            "l": MISTRAL_MODEL_L,
-            "r": MISTRAL_MODEL_R,
-        }.get(size, MISTRAL_MODEL_M)
+        model = _MISTRAL_MODELS.get(size, _MISTRAL_DEFAULT)
         print(f"Model in use: {model}")
         headers = {
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
-            "Accept": "application/json",
+            "Accept": "text/event-stream",
         }
         payload = {
             "model": model,
             "messages": messages,
-            "stream": False,
+            "stream": True,
             "temperature": 0.2,
             "max_tokens": context_limit,
         }
-        try:
-            resp = requests.post(MISTRAL_API_URL, json=payload, headers=headers, timeout=55)
-            resp.raise_for_status()
-            reply = resp.json()["choices"][0]["message"]["content"]
-        except Exception as exc:
-            return JsonResponse({"error": f"Mistral API call failed: {exc}"}, status=500)
+        failure = "Mistral API call failed"
+        deltas = _sse_deltas(MISTRAL_API_URL, payload, headers, timeout=55, shared=shared_clients)
 
     elif local == "openai":
-        if OpenAI is None:
-            return JsonResponse({"error": "openai library not installed"}, status=500)
+        if AsyncOpenAI is None:
+            return _json_response({"error": "openai library not installed"}, status=500)
         api_key = os.environ.get("OPENAI_API_KEY")
         if not api_key:
-            return JsonResponse({"error": "OpenAI API key is empty"}, status=500)
-        client = OpenAI(api_key=api_key)
+            return _json_response({"error": "OpenAI API key is empty"}, status=500)
         messages = _build_messages(history, combined_system)
-        model_name = {
-            "s": OPENAI_MODEL_S,
-            "m": OPENAI_MODEL_L,
-            "l": OPENAI_MODEL_L,
-            "r": OPENAI_MODEL_R,
-        }.get(size, OPENAI_MODEL_L)
+        model_name = _OPENAI_MODELS.get(size, _OPENAI_DEFAULT)
         reasoning = {"effort": "high"} if size == "r" else {"effort": "minimal"} if size == "s" else None
         print(f"Model in use: {model_name}")
-        try:
-            resp = client.responses.create(
-                model=model_name,
-                input=messages,
-                text={"verbosity": verbosity},
-                max_output_tokens=context_limit,
-                **({"reasoning": reasoning} if reasoning else {}),
-            )
-            reply = resp.output_text
-        except Exception as exc:
-            return JsonResponse({"error": f"OpenAI API call failed: {exc}"}, status=500)
+        failure = "OpenAI API call failed"
+        deltas = _openai_deltas(
+            api_key,
+            shared_clients,
+            model=model_name,
+            input=messages,
+            text={"verbosity": verbosity},
+            max_output_tokens=context_limit,
+            **({"reasoning": reasoning} if reasoning else {}),
+        )
 
     elif local == "openrouter":
-        if requests is None:
-            return JsonResponse({"error": "requests library not installed"}, status=500)
+        if httpx is None:
+            return _json_response({"error": "httpx library not installed"}, status=500)
         api_key = os.getenv("OPENROUTER_API_KEY")
         if not api_key:
-            return JsonResponse({"error": "OPENROUTER_API_KEY not set"}, status=500)
+            return _json_response({"error": "OPENROUTER_API_KEY not set"}, status=500)
 
         messages = _build_messages(history, combined_system)
-        model_name = {
-            "s": OPENROUTER_MODEL_S,
-            "m": OPENROUTER_MODEL_M,
-            "l": OPENROUTER_MODEL_L,
-            "r": OPENROUTER_MODEL_L,
-        }.get(size, OPENROUTER_MODEL_S)
+        model_name = _OPENROUTER_MODELS.get(size, _OPENROUTER_DEFAULT)
         print(f"Model in use: {model_name}")
 
         body = {
             "model": model_name,
             "messages": messages,
+            "stream": True,
             "temperature": 0.3,
             "max_tokens": context_limit,
             "provider": {
@@ -414,34 +533,71 @@ def programming_helper_send_message(request):  # noqa: C901
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
         }
-        try:
-            resp = requests.post(OPENROUTER_BASE_URL, json=body, headers=headers, timeout=120)
-            resp.raise_for_status()
-            data = resp.json()
-            reply = data["choices"][0]["message"]["content"]
-        except Exception as exc:
-            return JsonResponse({"error": f"OpenRouter API call failed: {exc}"}, status=500)
+        failure = "OpenRouter API call failed"
+        deltas = _sse_deltas(OPENROUTER_BASE_URL, body, headers, timeout=120, shared=shared_clients)
 
     else:
-        return JsonResponse({"error": f"Unknown local value '{local}'"}, status=400)
+        return _json_response({"error": f"Unknown local value '{local}'"}, status=400)
 
-    # Append assistant turn & return
-    with LOCK:
-        history.append(("assistant", reply))
-    full_state = _conversation_dump(character)
+    # Prompt/persona dumps can be several times the size of the reply: opt-in only
+    debug = settings.DEBUG or request.GET.get("debug") == "1"
 
-    return JsonResponse({
-        "response": reply,
-        "conversations": full_state,
-        "debug_prompt": {
-            "system": combined_system,
-            "messages": _build_messages(history, combined_system),
-            "flat_prompt": prompt_for_ollama
-        },
-        "persona_debug": {
-            "nome": persona_obj.nome,
-            "versione": persona_obj.versione,
-            "contenuto": persona_obj.contenuto,
-            "esperienze": persona_obj.esperienze,
+    async def finish_turn(reply: str) -> Dict[str, Any]:
+        # Append assistant turn & build the final response object
+        with state.lock:
+            state.append("assistant", reply)
+            turns = tuple(state.history) if debug and messages is None else history
+        full_state = await sync_to_async(_conversation_dump)(character)
+
+        response_data = {
+            "response": reply,
+            "conversations": full_state,
         }
-    })
+        if debug:
+            if messages is None:
+                debug_messages = _build_messages(turns, combined_system)
+            else:
+                # Reuse the list sent to the provider instead of rebuilding it
+                messages.append({"role": "assistant", "content": reply})
+                debug_messages = messages
+            response_data["debug_prompt"] = {
+                "system": combined_system,
+                "messages": debug_messages,
+                "flat_prompt": prompt_for_ollama
+            }
+            response_data["persona_debug"] = {
+                "nome": persona_obj.nome,
+                "versione": persona_obj.versione,
+                "contenuto": persona_obj.contenuto,
+                "esperienze": persona_obj.esperienze,
+            } if persona_obj else None
+        return response_data
+
+    if data.get("stream"):
+        async def ndjson():
+            parts: List[str] = []
+            try:
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield _json_dumps({"delta": delta}) + b"\n"
+            except Exception as exc:
+                yield _json_dumps({"error": f"{failure}: {exc}"}) + b"\n"
+                return
+            if not parts:
+                yield _json_dumps({"error": f"{failure}: empty response"}) + b"\n"
+                return
+            yield _json_dumps(await finish_turn("".join(parts))) + b"\n"
+
+        response = StreamingHttpResponse(ndjson(), content_type="application/x-ndjson")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    try:
+        reply = "".join([delta async for delta in deltas])
+    except Exception as exc:
+        return _json_response({"error": f"{failure}: {exc}"}, status=500)
+    if not reply:
+        # Never store an empty assistant turn
+        return _json_response({"error": f"{failure}: empty response"}, status=500)
+    return _json_response(await finish_turn(reply))
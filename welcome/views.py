@@ -1,7 +1,6 @@
-import json
-from django.http import JsonResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
+from .chatbot_utils import _json_loads, _json_response
 from .models import UtenteApi
 
 
@@ -15,10 +14,10 @@ def chat_persona(request):
 
 @csrf_exempt
 def check_user(request):
-    data = json.loads(request.body.decode('utf-8'))
+    data = _json_loads(request.body)
     name = data.get('name')
     try:
         user = UtenteApi.objects.get(nome=name)
-        return JsonResponse({'exists': True, 'nome': user.nome})
+        return _json_response({'exists': True, 'nome': user.nome})
     except UtenteApi.DoesNotExist:
-        return JsonResponse({'exists': False})
+        return _json_response({'exists': False})